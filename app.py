@@ -6,11 +6,13 @@ import os
 from dotenv import load_dotenv
 import base64
 import io
+import time
 from PIL import Image # Need to install Pillow
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from google.cloud import vision
 from food_classifier import predict_from_base64
+from food_log import create_food_log, parse_day
 
 # Load environment variables
 load_dotenv()
@@ -39,6 +41,17 @@ except Exception as e:
     print(f"Warning: Failed to initialize Firestore client: {e}")
     db = None
 
+# Per-user food log with running daily totals (falls back to local SQLite without Firestore).
+# Each worker process keeps its own cache; totals logged by other workers show up once
+# the cached dailyTotals expire (food_log.CACHE_TTL).
+food_log = create_food_log(db)
+
+# Cached nutrition targets per user as (targets, monotonic time). Invalidated when this
+# worker handles a profile update, and re-read after TARGETS_CACHE_TTL seconds so updates
+# handled by other workers show up.
+TARGETS_CACHE_TTL = 60
+_targets_cache = {}
+
 # Initialize Google Cloud Vision client
 vision_client = vision.ImageAnnotatorClient()
 
@@ -235,6 +248,7 @@ def profile():
                  return redirect(url_for('profile'))
 
             profile_doc_ref.set(profile_data, merge=True) 
+            _targets_cache.pop(user_email, None)
             flash("Profile updated successfully!", "success")
             
         except ValueError:
@@ -334,6 +348,30 @@ def calculate_nutrition_needs(profile_data):
         print(f"Error during calculation: {e}. Profile data: {profile_data}")
         return None # Indicate calculation failure
 
+REQUIRED_PROFILE_FIELDS = ['age', 'weight', 'height', 'gender', 'activity_level', 'goal']
+
+def get_user_targets(user_email):
+    """Return cached nutrition targets, computing them from the profile on first use"""
+    cached = _targets_cache.get(user_email)
+    if cached is not None and time.monotonic() - cached[1] < TARGETS_CACHE_TTL:
+        return cached[0]
+    targets = None
+    if db:
+        doc = db.collection('userProfiles').document(user_email).get()
+        if doc.exists:
+            user_profile = doc.to_dict()
+            if all(user_profile.get(field) is not None for field in REQUIRED_PROFILE_FIELDS):
+                targets = calculate_nutrition_needs(user_profile)
+    if targets is not None:
+        cache_user_targets(user_email, targets)
+    return targets
+
+def cache_user_targets(user_email, targets):
+    now = time.monotonic()
+    for email in [email for email, (_, cached_at) in _targets_cache.items() if now - cached_at >= TARGETS_CACHE_TTL]:
+        del _targets_cache[email]
+    _targets_cache[user_email] = (targets, now)
+
 @app.route("/personalized_meal_plan")
 def personalized_meal_plan():
     if 'user' not in session:
@@ -349,6 +387,8 @@ def personalized_meal_plan():
     
     user_profile = {}
     targets = None
+    consumed = None
+    remaining = None
     error_message = None
 
     try:
@@ -356,11 +396,14 @@ def personalized_meal_plan():
         if doc.exists:
             user_profile = doc.to_dict()
             # Check if ALL required data exists for calculation
-            required_fields = ['age', 'weight', 'height', 'gender', 'activity_level', 'goal']
+            required_fields = REQUIRED_PROFILE_FIELDS
             if all(field in user_profile and user_profile[field] is not None for field in required_fields):
                  targets = calculate_nutrition_needs(user_profile)
                  if targets is None: # Check if calculation itself failed
                       error_message = "Calculation failed. Please ensure profile data is valid."
+                 else:
+                      cache_user_targets(user_email, targets)
+                      consumed, remaining = food_log.get_remaining(user_email, targets)
             else:
                 missing = [field for field in required_fields if field not in user_profile or user_profile[field] is None]
                 error_message = f"Please complete your profile ({', '.join(missing).replace('_',' ').title()}) to calculate your plan."
@@ -374,7 +417,34 @@ def personalized_meal_plan():
     if error_message:
          flash(error_message, "warning")
 
-    return render_template("meal_plan.html", targets=targets, error=error_message)
+    return render_template("meal_plan.html", targets=targets, consumed=consumed,
+                           remaining=remaining, error=error_message)
+
+@app.route("/api/daily_summary", methods=["GET"])
+def daily_summary():
+    if 'user' not in session:
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+
+    user_email = session.get('user')
+    day = request.args.get('day')  # client's local YYYY-MM-DD, defaults to today (UTC)
+    if day:
+        try:
+            day = parse_day(day)
+        except ValueError:
+            return jsonify({"success": False, "error": "Invalid day, expected YYYY-MM-DD"}), 400
+
+    try:
+        targets = get_user_targets(user_email)
+        consumed, remaining = food_log.get_remaining(user_email, targets, day)
+        return jsonify({
+            "success": True,
+            "consumed": consumed,
+            "targets": targets,
+            "remaining": remaining
+        })
+    except Exception as e:
+        print(f"Error building daily summary for {user_email}: {e}")
+        return jsonify({"success": False, "error": "Could not load daily summary"}), 500
 
 def get_food_nutrition(food_name):
     """Get nutritional information from Nutritionix API"""
@@ -415,6 +485,12 @@ def analyze_food():
         return jsonify({"success": False, "error": "Missing image_base64 data"}), 400
 
     image_base64 = data['image_base64']
+    day = data.get('day')  # client's local YYYY-MM-DD, defaults to today (UTC)
+    if day:
+        try:
+            day = parse_day(day)
+        except ValueError:
+            return jsonify({"success": False, "error": "Invalid day, expected YYYY-MM-DD"}), 400
 
     try:
         # Use local classifier to predict food label
@@ -446,10 +522,22 @@ def analyze_food():
                 "sugars_g": nutrition_data['sugar']
             }
 
+        # Append to the user's food log; persisted in the background.
+        # Placeholder values are not logged so they don't skew the daily totals.
+        logged = False
+        if nutrition_data:
+            try:
+                food_log.log_food(session['user'], nutrition_facts, day)
+                logged = True
+            except Exception as e:
+                print(f"Error logging food for {session['user']}: {e}")
+
         return jsonify({
             "success": True,
             "food_item": food_item,
-            "nutrition_facts": nutrition_facts
+            "nutrition_facts": nutrition_facts,
+            "estimated": not nutrition_data,
+            "logged": logged
         })
 
     except Exception as e:
@@ -0,0 +1,392 @@
+import atexit
+import datetime
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+SQLITE_PATH = "food_log.db"
+
+# Writer thread flushes when this many entries are pending or the interval elapses.
+# Keep BATCH_SIZE <= 250: Firestore allows 500 writes per batch and each entry takes 2.
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 2.0
+
+# Failed batches are re-sent after an exponential backoff before being dropped
+MAX_WRITE_ATTEMPTS = 5
+RETRY_BACKOFF = 1.0
+
+# Persisted totals of recent days are cached in memory and re-read after this many seconds
+CACHE_TTL = 30.0
+
+# Daily aggregate fields, named like the targets from calculate_nutrition_needs
+TOTAL_FIELDS = ("calories", "protein_g", "carbs_g", "fat_g", "sugar_g")
+
+# Mapping from the nutrition_facts keys returned by /api/analyze_food
+NUTRITION_FACTS_FIELDS = {
+    "calories": "calories",
+    "protein_g": "protein_g",
+    "carbs_g": "carbohydrate_total_g",
+    "fat_g": "fat_total_g",
+    "sugar_g": "sugars_g",
+}
+
+# Mapping from daily total field to the matching calculate_nutrition_needs key
+TARGET_FIELDS = {
+    "calories": "target_calories",
+    "protein_g": "protein_g",
+    "carbs_g": "carbs_g",
+    "fat_g": "fat_g",
+    "sugar_g": "sugar_g",
+}
+
+
+class EntriesAlreadyWritten(Exception):
+    """Raised by a store when a re-sent batch was already committed by an earlier attempt"""
+
+
+def empty_totals():
+    return {field: 0.0 for field in TOTAL_FIELDS}
+
+
+def today_utc():
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+
+def parse_day(value):
+    """Validate a YYYY-MM-DD day, raising ValueError for anything else"""
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid day: {value!r}")
+    return datetime.date.fromisoformat(value).isoformat()
+
+
+def is_recent_day(day):
+    # The client's local date is always within one day of the UTC date
+    delta = datetime.date.fromisoformat(day) - datetime.date.fromisoformat(today_utc())
+    return abs(delta.days) <= 1
+
+
+def remaining_vs_targets(totals, targets):
+    """Return target minus consumed for every tracked field (negative means over target)"""
+    if not targets:
+        return None
+    return {
+        field: round(targets[target_key] - totals.get(field, 0.0), 1)
+        for field, target_key in TARGET_FIELDS.items()
+        if target_key in targets
+    }
+
+
+class FirestoreFoodLogStore:
+    """Entries in foodLogs/{user}/entries, running totals in foodLogs/{user}/dailyTotals/{day}"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _user_ref(self, user):
+        return self.db.collection('foodLogs').document(user)
+
+    def load_totals(self, user, day):
+        doc = self._user_ref(user).collection('dailyTotals').document(day).get()
+        totals = empty_totals()
+        if doc.exists:
+            data = doc.to_dict()
+            for field in TOTAL_FIELDS:
+                totals[field] = float(data.get(field, 0.0))
+        return totals
+
+    def write_entries(self, entries):
+        # The batch is atomic and creates entries under their stable ids, so re-sending a
+        # batch that already committed fails as a whole instead of incrementing twice
+        batch = self.db.batch()
+        for entry in entries:
+            user_ref = self._user_ref(entry['user'])
+            batch.create(user_ref.collection('entries').document(entry['id']), entry)
+            increments = {field: firestore.Increment(entry[field]) for field in TOTAL_FIELDS}
+            increments['day'] = entry['day']
+            batch.set(user_ref.collection('dailyTotals').document(entry['day']), increments, merge=True)
+        try:
+            batch.commit()
+        except AlreadyExists as e:
+            raise EntriesAlreadyWritten(str(e)) from e
+
+
+class SQLiteFoodLogStore:
+    """Local stand-in for Firestore, used when the Firestore client is unavailable"""
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS food_log_entries ("
+                "id TEXT PRIMARY KEY, user TEXT NOT NULL, day TEXT NOT NULL, "
+                "logged_at TEXT NOT NULL, name TEXT, "
+                + ", ".join(f"{field} REAL NOT NULL DEFAULT 0" for field in TOTAL_FIELDS) + ")"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS food_log_daily_totals ("
+                "user TEXT NOT NULL, day TEXT NOT NULL, "
+                + ", ".join(f"{field} REAL NOT NULL DEFAULT 0" for field in TOTAL_FIELDS)
+                + ", PRIMARY KEY (user, day))"
+            )
+        conn.close()
+
+    def _connect(self):
+        # A fresh connection per call keeps this safe to use from request threads and the writer thread
+        return sqlite3.connect(self.path, timeout=10)
+
+    def load_totals(self, user, day):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(TOTAL_FIELDS)} FROM food_log_daily_totals WHERE user = ? AND day = ?",
+                (user, day),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return empty_totals()
+        return dict(zip(TOTAL_FIELDS, row))
+
+    def write_entries(self, entries):
+        columns = ", ".join(TOTAL_FIELDS)
+        placeholders = ", ".join("?" for _ in TOTAL_FIELDS)
+        increments = ", ".join(f"{field} = {field} + excluded.{field}" for field in TOTAL_FIELDS)
+        conn = self._connect()
+        try:
+            with conn:
+                try:
+                    conn.executemany(
+                        f"INSERT INTO food_log_entries (id, user, day, logged_at, name, {columns}) "
+                        f"VALUES (?, ?, ?, ?, ?, {placeholders})",
+                        [(e['id'], e['user'], e['day'], e['logged_at'], e['name'], *(e[f] for f in TOTAL_FIELDS))
+                         for e in entries],
+                    )
+                except sqlite3.IntegrityError as e:
+                    # Duplicate entry id: the transaction rolls back, nothing is counted twice
+                    raise EntriesAlreadyWritten(str(e)) from e
+                conn.executemany(
+                    f"INSERT INTO food_log_daily_totals (user, day, {columns}) VALUES (?, ?, {placeholders}) "
+                    f"ON CONFLICT(user, day) DO UPDATE SET {increments}",
+                    [(e['user'], e['day'], *(e[f] for f in TOTAL_FIELDS)) for e in entries],
+                )
+        finally:
+            conn.close()
+
+
+class FoodLog:
+    """Per-user food log with running per-day totals.
+
+    Entries are persisted in batches by a background writer thread, off the
+    request path, and the store keeps the true running sum per day in a single
+    dailyTotals doc/row. This process caches those persisted totals for recent
+    days (refreshed every CACHE_TTL seconds, so totals logged by other workers
+    show up) and adds its own not-yet-written entries on top, so reading a
+    day's totals never rescans its entries. All days are UTC dates unless the
+    caller passes the client's local date.
+
+    A batch that failed may still have been committed; until its retry settles
+    it, its entries can be counted twice for its days.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._persisted = {}  # (user, day) -> (totals loaded from the store, monotonic load time)
+        self._unsaved = {}  # (user, day) -> totals of entries logged here but not yet written
+        self._write_seq = 0  # bumped whenever a batch write starts or settles
+        self._writes_in_flight = 0
+        self._lock = threading.Lock()
+        self._settled = threading.Condition(self._lock)
+        self._pending = queue.Queue()
+        self._retries = []  # (not before, attempts so far, entries) for failed batches
+        self._writer = threading.Thread(target=self._write_loop, name="food-log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _prune_persisted(self):
+        # Caller must hold self._lock
+        for key in [key for key in self._persisted if not is_recent_day(key[1])]:
+            del self._persisted[key]
+
+    def _with_unsaved(self, persisted, key):
+        # Caller must hold self._lock, so persisted and unsaved totals are a consistent pair
+        totals = dict(persisted)
+        unsaved = self._unsaved.get(key)
+        if unsaved:
+            for field in TOTAL_FIELDS:
+                totals[field] += unsaved[field]
+        return {field: round(value, 1) for field, value in totals.items()}
+
+    def log_food(self, user, nutrition_facts, day=None):
+        """Append an analyzed food item to the user's log and update the day's totals"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        day = parse_day(day) if day else now.date().isoformat()
+        entry = {
+            'id': uuid.uuid4().hex,
+            'user': user,
+            'day': day,
+            'logged_at': now.isoformat(timespec='seconds'),
+            'name': nutrition_facts.get('name'),
+        }
+        for field, facts_key in NUTRITION_FACTS_FIELDS.items():
+            entry[field] = float(nutrition_facts.get(facts_key) or 0)
+
+        with self._lock:
+            unsaved = self._unsaved.setdefault((user, day), empty_totals())
+            for field in TOTAL_FIELDS:
+                unsaved[field] += entry[field]
+        self._pending.put(entry)
+        return entry
+
+    def get_daily_totals(self, user, day=None):
+        day = parse_day(day) if day else today_utc()
+        key = (user, day)
+        while True:
+            with self._lock:
+                cached = self._persisted.get(key)
+                if cached is not None and time.monotonic() - cached[1] < CACHE_TTL:
+                    return self._with_unsaved(cached[0], key)
+                while self._writes_in_flight:
+                    self._settled.wait()
+                seq = self._write_seq
+
+            # Single document/row lookup, done without holding the lock
+            totals = self.store.load_totals(user, day)
+
+            with self._lock:
+                # A write that started meanwhile may or may not be in the loaded totals
+                # while already (or still) counted as unsaved, so read again
+                if seq != self._write_seq:
+                    continue
+                if is_recent_day(day):
+                    self._prune_persisted()
+                    self._persisted[key] = (totals, time.monotonic())
+                return self._with_unsaved(totals, key)
+
+    def get_remaining(self, user, targets, day=None):
+        totals = self.get_daily_totals(user, day)
+        return totals, remaining_vs_targets(totals, targets)
+
+    def _settle(self, entries, persisted, reload):
+        """Move entries out of the unsaved totals (into the cached store totals if persisted)
+
+        Caller must hold self._lock. With reload, cached store totals of the entries'
+        days are dropped instead, because an earlier failed attempt may already be in them.
+        """
+        for entry in entries:
+            key = (entry['user'], entry['day'])
+            unsaved = self._unsaved.get(key)
+            if unsaved is not None:
+                for field in TOTAL_FIELDS:
+                    unsaved[field] -= entry[field]
+                if all(abs(value) < 1e-9 for value in unsaved.values()):
+                    del self._unsaved[key]
+            if reload:
+                self._persisted.pop(key, None)
+            elif persisted and key in self._persisted:
+                for field in TOTAL_FIELDS:
+                    self._persisted[key][0][field] += entry[field]
+
+    def _write_batch(self, entries, attempts):
+        with self._lock:
+            self._writes_in_flight += 1
+            self._write_seq += 1
+        try:
+            self.store.write_entries(entries)
+            persisted = True
+        except EntriesAlreadyWritten:
+            # An earlier attempt committed this batch but reported an error
+            persisted = True
+        except Exception as e:
+            print(f"Error writing {len(entries)} food log entries: {e}")
+            persisted = False
+
+        with self._lock:
+            if persisted:
+                self._settle(entries, persisted=True, reload=attempts > 0)
+            elif attempts + 1 >= MAX_WRITE_ATTEMPTS:
+                # Give up on these so the totals don't report food that was never saved
+                print(f"Dropping {len(entries)} food log entries after {MAX_WRITE_ATTEMPTS} attempts")
+                self._settle(entries, persisted=False, reload=True)
+            else:
+                # Re-sent later as the same batch, so a commit that errored is detected as a whole
+                not_before = time.monotonic() + RETRY_BACKOFF * 2 ** attempts
+                self._retries.append((not_before, attempts + 1, entries))
+            self._writes_in_flight -= 1
+            self._write_seq += 1
+            self._settled.notify_all()
+
+    def _send_due_retries(self):
+        """Re-send failed batches whose backoff has passed; return seconds until the next one"""
+        now = time.monotonic()
+        with self._lock:
+            due = [retry for retry in self._retries if retry[0] <= now]
+            self._retries = [retry for retry in self._retries if retry[0] > now]
+        for _, attempts, entries in due:
+            self._write_batch(entries, attempts)
+        with self._lock:
+            if not self._retries:
+                return None
+            return max(0.0, min(retry[0] for retry in self._retries) - time.monotonic())
+
+    def _write_loop(self):
+        while True:
+            wait = self._send_due_retries()
+            try:
+                entries = [self._pending.get(timeout=wait)]
+            except queue.Empty:
+                continue
+            # Wait up to FLUSH_INTERVAL for more entries so they share one batch write
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(entries) < BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entries.append(self._pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write_batch(entries, 0)
+            for _ in entries:
+                self._pending.task_done()
+
+    def flush(self):
+        """Write all pending entries now and wait for the writer thread (used at shutdown)
+
+        Failed batches get one final attempt without waiting out their backoff.
+        """
+        while True:
+            entries = []
+            while len(entries) < BATCH_SIZE:
+                try:
+                    entries.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            if not entries:
+                break
+            self._write_batch(entries, 0)
+            for _ in entries:
+                self._pending.task_done()
+        self._pending.join()
+
+        while True:
+            with self._lock:
+                while self._writes_in_flight:
+                    self._settled.wait()
+                retries, self._retries = self._retries, []
+            if not retries:
+                break
+            for _, _, entries in retries:
+                self._write_batch(entries, MAX_WRITE_ATTEMPTS - 1)
+
+
+def create_food_log(db=None):
+    """Use Firestore when a client is available, otherwise the local SQLite stand-in"""
+    if db is not None:
+        return FoodLog(FirestoreFoodLogStore(db))
+    return FoodLog(SQLiteFoodLogStore())
@@ -0,0 +1,76 @@
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, ServiceUnavailable
+
+
+class FakeDocument:
+    def __init__(self, data):
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeRef:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def collection(self, name):
+        return FakeRef(self.db, self.path + (name,))
+
+    def document(self, doc_id):
+        return FakeRef(self.db, self.path + (doc_id,))
+
+    def get(self):
+        return FakeDocument(self.db.docs.get(self.path))
+
+    def set(self, data, merge=False):
+        self.db.apply_set(self.path, data, merge)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def create(self, ref, data):
+        self.ops.append(("create", ref.path, data, False))
+
+    def set(self, ref, data, merge=False):
+        self.ops.append(("set", ref.path, data, merge))
+
+    def commit(self):
+        self.db.batches.append(self.ops)
+        # Atomic like Firestore: nothing is applied if any create target exists
+        if any(op == "create" and path in self.db.docs for op, path, _, _ in self.ops):
+            raise AlreadyExists("Document already exists")
+        for op, path, data, merge in self.ops:
+            self.db.apply_set(path, data, merge)
+        if self.db.errors_after_commit:
+            self.db.errors_after_commit -= 1
+            raise ServiceUnavailable("Deadline exceeded after commit")
+
+
+class FakeFirestore:
+    """In-memory stand-in for the parts of the Firestore client used by the app"""
+
+    def __init__(self):
+        self.docs = {}
+        self.batches = []
+        self.errors_after_commit = 0
+
+    def collection(self, name):
+        return FakeRef(self, (name,))
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def apply_set(self, path, data, merge):
+        doc = dict(self.docs.get(path, {})) if merge else {}
+        for key, value in data.items():
+            if isinstance(value, firestore.Increment):
+                doc[key] = doc.get(key, 0) + value.value
+            else:
+                doc[key] = value
+        self.docs[path] = doc
@@ -0,0 +1,136 @@
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("dotenv")
+pytest.importorskip("google.cloud.vision")
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+from google.cloud import vision
+
+import food_log
+from fake_firestore import FakeFirestore
+from food_log import FoodLog, SQLiteFoodLogStore
+
+NUTRITION = {"name": "pizza", "calories": 285, "protein": 12, "carbs": 36, "sugar": 3.6, "fats": 10}
+
+PROFILE = {"age": 30, "weight": 70.0, "height": 175, "gender": "male", "activity_level": "light", "goal": "maintain"}
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    """Import app.py without Firebase credentials, Cloud Vision or the local model weights"""
+    patch = pytest.MonkeyPatch()
+    patch.chdir(tmp_path_factory.mktemp("app"))  # uploads/ and food_log.db are created in the cwd
+    patch.setattr(credentials, "Certificate", lambda path: None)
+    patch.setattr(firebase_admin, "initialize_app", lambda cred: None)
+    patch.setattr(firestore, "client", lambda: None)
+    patch.setattr(vision, "ImageAnnotatorClient", lambda: None)
+    # food_classifier loads the model weights from a local path at import time
+    patch.setitem(sys.modules, "food_classifier", types.SimpleNamespace(predict_from_base64=None))
+    patch.delitem(sys.modules, "app", raising=False)
+    import app
+    yield app
+    patch.undo()
+
+
+@pytest.fixture
+def app_env(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(food_log, "FLUSH_INTERVAL", 0.05)
+    monkeypatch.setattr(app_module, "db", FakeFirestore())
+    monkeypatch.setattr(app_module, "food_log", FoodLog(SQLiteFoodLogStore(str(tmp_path / "food_log.db"))))
+    monkeypatch.setattr(app_module, "_targets_cache", {})
+    monkeypatch.setattr(app_module, "predict_from_base64", lambda image: "pizza (91.00%) | lasagna (5.00%)")
+    monkeypatch.setattr(app_module, "get_food_nutrition", lambda name: dict(NUTRITION))
+    return app_module
+
+
+@pytest.fixture
+def client(app_env):
+    client = app_env.app.test_client()
+    with client.session_transaction() as session:
+        session['user'] = "a@b.c"
+    return client
+
+
+def test_analyze_food_logs_nutrition_for_client_day(app_env, client):
+    response = client.post("/api/analyze_food", json={"image_base64": "abc", "day": "2024-01-01"})
+
+    assert response.status_code == 200
+    assert response.json["logged"] is True
+    assert response.json["estimated"] is False
+    assert app_env.food_log.get_daily_totals("a@b.c", "2024-01-01")["calories"] == 285.0
+
+
+def test_analyze_food_does_not_log_placeholder_nutrition(app_env, client, monkeypatch):
+    monkeypatch.setattr(app_env, "get_food_nutrition", lambda name: None)
+
+    response = client.post("/api/analyze_food", json={"image_base64": "abc"})
+
+    assert response.status_code == 200
+    assert response.json["estimated"] is True
+    assert response.json["logged"] is False
+    assert response.json["nutrition_facts"]["calories"] == 100
+    assert app_env.food_log.get_daily_totals("a@b.c")["calories"] == 0.0
+
+
+def test_analyze_food_survives_logging_errors(app_env, client, monkeypatch):
+    def failing_log_food(*args):
+        raise RuntimeError("store unavailable")
+
+    monkeypatch.setattr(app_env.food_log, "log_food", failing_log_food)
+
+    response = client.post("/api/analyze_food", json={"image_base64": "abc"})
+
+    assert response.status_code == 200
+    assert response.json["success"] is True
+    assert response.json["logged"] is False
+
+
+@pytest.mark.parametrize("day", ["garbage", "2024-13-01", "a/b"])
+def test_invalid_day_returns_400(app_env, client, day):
+    response = client.post("/api/analyze_food", json={"image_base64": "abc", "day": day})
+    assert response.status_code == 400
+
+    response = client.get("/api/daily_summary", query_string={"day": day})
+    assert response.status_code == 400
+    assert not app_env.food_log._persisted
+
+
+def test_daily_summary_reports_remaining_vs_targets(app_env, client):
+    app_env.db.collection('userProfiles').document("a@b.c").set(PROFILE)
+    client.post("/api/analyze_food", json={"image_base64": "abc", "day": "2024-01-01"})
+
+    response = client.get("/api/daily_summary", query_string={"day": "2024-01-01"})
+
+    body = response.json
+    assert response.status_code == 200
+    assert body["consumed"]["calories"] == 285.0
+    assert body["remaining"]["calories"] == body["targets"]["target_calories"] - 285.0
+
+
+def test_profile_update_clears_cached_targets(app_env, client):
+    app_env.db.collection('userProfiles').document("a@b.c").set(PROFILE)
+    before = client.get("/api/daily_summary").json["targets"]
+    assert "a@b.c" in app_env._targets_cache
+
+    client.post("/profile", data={"weight": "90"})
+
+    assert "a@b.c" not in app_env._targets_cache
+    after = client.get("/api/daily_summary").json["targets"]
+    assert after["target_calories"] > before["target_calories"]
+
+
+def test_cached_targets_expire(app_env, client, monkeypatch):
+    profile_ref = app_env.db.collection('userProfiles').document("a@b.c")
+    profile_ref.set(PROFILE)
+    before = client.get("/api/daily_summary").json["targets"]
+
+    # Another worker updates the profile; this worker only sees it once the cache expires
+    profile_ref.set({"weight": 90.0}, merge=True)
+    assert client.get("/api/daily_summary").json["targets"] == before
+    monkeypatch.setattr(app_env, "TARGETS_CACHE_TTL", 0)
+    assert client.get("/api/daily_summary").json["targets"]["target_calories"] > before["target_calories"]
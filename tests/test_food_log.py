@@ -0,0 +1,151 @@
+import pytest
+from firebase_admin import firestore
+
+import food_log
+from fake_firestore import FakeFirestore
+from food_log import FirestoreFoodLogStore, FoodLog, SQLiteFoodLogStore, today_utc
+
+PIZZA = {
+    "name": "pizza",
+    "calories": 285,
+    "protein_g": 12,
+    "fat_total_g": 10,
+    "carbohydrate_total_g": 36,
+    "sugars_g": 3.6,
+}
+
+TARGETS = {"target_calories": 2000, "protein_g": 150, "carbs_g": 200, "fat_g": 60, "sugar_g": 50}
+
+
+@pytest.fixture(autouse=True)
+def fast_writer(monkeypatch):
+    monkeypatch.setattr(food_log, "FLUSH_INTERVAL", 0.05)
+    monkeypatch.setattr(food_log, "RETRY_BACKOFF", 0.0)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "food_log.db")
+
+
+def test_log_food_updates_totals(db_path):
+    log = FoodLog(SQLiteFoodLogStore(db_path))
+    log.log_food("a@b.c", PIZZA)
+    log.log_food("a@b.c", PIZZA)
+
+    assert log.get_daily_totals("a@b.c") == {
+        "calories": 570.0, "protein_g": 24.0, "carbs_g": 72.0, "fat_g": 20.0, "sugar_g": 7.2,
+    }
+    assert log.get_daily_totals("other@b.c")["calories"] == 0.0
+
+
+def test_get_remaining_against_targets(db_path):
+    log = FoodLog(SQLiteFoodLogStore(db_path))
+    log.log_food("a@b.c", PIZZA)
+
+    consumed, remaining = log.get_remaining("a@b.c", TARGETS)
+    assert consumed["calories"] == 285.0
+    assert remaining == {"calories": 1715.0, "protein_g": 138.0, "carbs_g": 164.0, "fat_g": 50.0, "sugar_g": 46.4}
+    assert log.get_remaining("a@b.c", None)[1] is None
+
+
+def test_writer_persists_entries_and_accumulates_daily_totals(db_path):
+    store = SQLiteFoodLogStore(db_path)
+    log = FoodLog(store)
+    for _ in range(3):
+        log.log_food("a@b.c", PIZZA)
+    log.log_food("a@b.c", PIZZA, day="2024-01-01")
+    log.flush()
+
+    conn = store._connect()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM food_log_entries").fetchone()[0] == 4
+    finally:
+        conn.close()
+    assert store.load_totals("a@b.c", today_utc())["calories"] == pytest.approx(855.0)
+    assert store.load_totals("a@b.c", "2024-01-01")["calories"] == pytest.approx(285.0)
+    # Totals are not counted twice once the entries have been written
+    assert log.get_daily_totals("a@b.c")["calories"] == 855.0
+
+
+def test_new_food_log_reloads_persisted_totals(db_path):
+    log = FoodLog(SQLiteFoodLogStore(db_path))
+    log.log_food("a@b.c", PIZZA)
+    log.log_food("a@b.c", PIZZA, day="2024-01-01")
+    log.flush()
+
+    reloaded = FoodLog(SQLiteFoodLogStore(db_path))
+    assert reloaded.get_daily_totals("a@b.c")["calories"] == 285.0
+    assert reloaded.get_daily_totals("a@b.c", "2024-01-01")["protein_g"] == 12.0
+
+
+@pytest.mark.parametrize("day", ["garbage", "2024-13-01", "2024/01/01", "../x", 20240101])
+def test_invalid_day_is_rejected(db_path, day):
+    log = FoodLog(SQLiteFoodLogStore(db_path))
+    with pytest.raises(ValueError):
+        log.get_daily_totals("a@b.c", day)
+    with pytest.raises(ValueError):
+        log.log_food("a@b.c", PIZZA, day=day)
+    assert not log._persisted
+
+
+def test_failed_writes_are_retried_then_removed_from_totals(db_path, monkeypatch):
+    monkeypatch.setattr(food_log, "MAX_WRITE_ATTEMPTS", 2)
+    store = SQLiteFoodLogStore(db_path)
+    attempts = []
+
+    def failing_write(entries):
+        attempts.append(len(entries))
+        raise RuntimeError("store unavailable")
+
+    monkeypatch.setattr(store, "write_entries", failing_write)
+    log = FoodLog(store)
+    log.log_food("a@b.c", PIZZA)
+    log.flush()
+
+    assert len(attempts) == 2
+    assert log.get_daily_totals("a@b.c")["calories"] == 0.0
+
+
+def test_firestore_store_creates_entries_and_increments_daily_totals():
+    db = FakeFirestore()
+    store = FirestoreFoodLogStore(db)
+    entries = [
+        {"id": entry_id, "user": "a@b.c", "day": "2024-01-01", "logged_at": "2024-01-01T12:00:00+00:00",
+         "name": "pizza", "calories": 285.0, "protein_g": 12.0, "carbs_g": 36.0, "fat_g": 10.0, "sugar_g": 3.6}
+        for entry_id in ("e1", "e2")
+    ]
+    store.write_entries(entries)
+
+    ops = db.batches[0]
+    assert [op[:2] for op in ops[::2]] == [
+        ("create", ("foodLogs", "a@b.c", "entries", "e1")),
+        ("create", ("foodLogs", "a@b.c", "entries", "e2")),
+    ]
+    op, path, data, merge = ops[1]
+    assert (op, path, merge) == ("set", ("foodLogs", "a@b.c", "dailyTotals", "2024-01-01"), True)
+    assert isinstance(data["calories"], firestore.Increment) and data["calories"].value == 285.0
+    assert data["day"] == "2024-01-01"
+    assert store.load_totals("a@b.c", "2024-01-01")["calories"] == 570.0
+
+    with pytest.raises(food_log.EntriesAlreadyWritten):
+        store.write_entries(entries)
+    assert store.load_totals("a@b.c", "2024-01-01")["calories"] == 570.0
+
+
+def test_firestore_retry_after_committed_batch_does_not_count_twice():
+    db = FakeFirestore()
+    db.errors_after_commit = 1
+    log = FoodLog(FirestoreFoodLogStore(db))
+    log.log_food("a@b.c", PIZZA)
+    log.log_food("a@b.c", PIZZA)
+    log.flush()
+
+    # First commit succeeded but reported an error; the same batch was re-sent and hit AlreadyExists
+    first_paths = [op[1] for op in db.batches[0]]
+    assert first_paths in [[op[1] for op in batch] for batch in db.batches[1:]]
+    entries = [path for path in db.docs if path[2] == "entries"]
+    assert len(entries) == 2
+    assert db.docs[("foodLogs", "a@b.c", "dailyTotals", today_utc())]["calories"] == 570.0
+    assert log.get_daily_totals("a@b.c")["calories"] == 570.0
+    assert not log._unsaved